@@ -7,6 +7,10 @@ from user import User
 from abc import ABC
 from abc import abstractmethod
 from transaction import Transaction
+from notifications import ThresholdEvent
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class BankAccount(ABC):
@@ -42,6 +46,8 @@ class BankAccount(ABC):
             "Eating Out": [],
             "Miscellaneous": []
         }
+        self.merchant_index = None
+        self.notifier = None
 
     def view_budgets(self) -> None:
         """
@@ -124,9 +130,9 @@ class BankAccount(ABC):
         """
         Executes the necessary steps for adding a transaction. If
         the transaction proceeds through each step successfully,
-        it is added to the dictionary of transactions and then the
-        spending in that category is checked against the
-        BankAccount's thresholds.
+        it is added to the dictionary of transactions (and the merchant
+        index, if one is attached) and then the spending in that category
+        is checked against the BankAccount's thresholds.
         :param category: a string
         """
         transaction = self.get_transaction_details()
@@ -136,8 +142,52 @@ class BankAccount(ABC):
             print("---> Transaction Added!")
             self.transactions[category].append(transaction)
             self.balance -= transaction.amount
+            if self.merchant_index is not None:
+                self.merchant_index.add(self.account_number, category,
+                                        transaction)
             self.check_thresholds(category)
 
+    def reverse_transaction(self, category: str,
+                            transaction: Transaction) -> None:
+        """
+        Reverses a transaction by removing it from the dictionary of
+        transactions (and the merchant index, if one is attached) and
+        refunding its amount to the balance. Nothing is changed unless
+        every step succeeds.
+        :param category: a string
+        :param transaction: a Transaction object
+        """
+        if transaction not in self.transactions[category]:
+            raise ValueError("This transaction was not recorded in this "
+                             "category.")
+        if self.merchant_index is not None:
+            self.merchant_index.reverse(self.account_number, category,
+                                        transaction)
+        self.transactions[category].remove(transaction)
+        self.balance += transaction.amount
+
+    def notify(self, category: str, tier: str, percentage: float,
+               message: str) -> None:
+        """
+        Publishes a threshold event to the attached notifier, if there
+        is one. Delivery happens in the background, and a notifier that
+        cannot take the event is logged rather than interrupting the
+        transaction.
+        :param category: a string, or None for the whole account
+        :param tier: a string (warning, exceed or lock)
+        :param percentage: a float, or None for the whole account
+        :param message: a string
+        """
+        if self.notifier is None:
+            return
+        try:
+            self.notifier.publish(ThresholdEvent(self.account_number,
+                                                 category, tier,
+                                                 percentage, message))
+        except Exception:
+            logger.exception("Unable to publish the %s notification for %s.",
+                             tier, self.account_number)
+
     @abstractmethod
     def warning_message(self, percentage: float) -> str:
         """
@@ -246,9 +296,13 @@ class AngelBankAccount(BankAccount):
 
         if percentage > self.warning_threshold:
             if percentage > 100:
-                print(self.exceed_message())
+                message = self.exceed_message()
+                print(message)
+                self.notify(category, "exceed", percentage, message)
             else:
-                print(self.warning_message(percentage))
+                message = self.warning_message(percentage)
+                print(message)
+                self.notify(category, "warning", percentage, message)
 
     def __str__(self):
         formatted = "----- Account Type: Angel -----\n"
@@ -316,12 +370,18 @@ class TroublemakerBankAccount(BankAccount):
 
         if percentage > self.warning_threshold:
             if percentage > self.lock_threshold:
-                print(self.lock_out())
+                message = self.lock_out()
+                print(message)
                 self.budget[category].locked = True
+                self.notify(category, "lock", percentage, message)
             elif percentage > 100:
-                print(self.exceed_message())
+                message = self.exceed_message()
+                print(message)
+                self.notify(category, "exceed", percentage, message)
             else:
-                print(self.warning_message(percentage))
+                message = self.warning_message(percentage)
+                print(message)
+                self.notify(category, "warning", percentage, message)
 
     def __str__(self):
         formatted = "----- Account Type: Troublemaker -----\n"
@@ -369,20 +429,31 @@ class RebelBankAccount(BankAccount):
         return "YOU HAVE EXCEEDED THIS BUDGET! IT IS NOW LOCKED. " \
                "SHAME ON YOU!\n"
 
+    def lock_out_message(self) -> str:
+        """
+        Returns an aggressive message notifying the Rebel that they have
+        been locked out of their account.
+        :return: a string
+        """
+        return "You have now exceeded two budgets! SHAME ON YOU.\n" \
+               "Your account is now FULLY locked.\n"
+
     def lock_out(self) -> None:
         """
         Displays an aggressive warning message notifying the Rebel that
         they have been locked out of their account, and locks each
         budget category.
         """
-        print("You have now exceeded two budgets! SHAME ON YOU.")
-        print("Your account is now FULLY locked.\n")
+        print(self.lock_out_message())
         for category in self.budget:
             self.budget[category].locked = True
 
-    def check_budgets(self) -> None:
+    def check_budgets(self) -> bool:
         """
-        Counts the number of budgets that have been exceeded/locked.
+        Counts the number of budgets that have been exceeded/locked, and
+        locks the whole account if there are two or more.
+        :return: a boolean flag representing whether the account was
+        locked
         """
         locked_count = 0
         for category in self.budget:
@@ -391,6 +462,8 @@ class RebelBankAccount(BankAccount):
 
         if locked_count >= 2:
             self.lock_out()
+            return True
+        return False
 
     def check_thresholds(self, category: str) -> None:
         """
@@ -404,11 +477,17 @@ class RebelBankAccount(BankAccount):
 
         if percentage > self.warning_threshold:
             if percentage > self.lock_threshold:
-                print(self.exceed_message())
+                message = self.exceed_message()
+                print(message)
                 self.budget[category].locked = True
-                self.check_budgets()
+                account_locked = self.check_budgets()
+                self.notify(category, "exceed", percentage, message)
+                if account_locked:
+                    self.notify(None, "lock", None, self.lock_out_message())
             else:
-                print(self.warning_message(percentage))
+                message = self.warning_message(percentage)
+                print(message)
+                self.notify(category, "warning", percentage, message)
 
     def __str__(self):
         formatted = "----- Account Type: Rebel -----\n"
@@ -0,0 +1,191 @@
+"""
+Contains code related to forecasting budget spending. Projects each
+budget category's spending forward from its transaction history and
+estimates when the warning, exceed and lock thresholds of each
+BankAccount type will be crossed.
+"""
+
+from datetime import datetime, timedelta
+import numpy as np
+from bank_account import RebelBankAccount
+
+TIERS = ("warning", "exceed", "lock")
+SECONDS_PER_DAY = 86400.0
+
+
+class SpendForecast:
+    """
+    Represents the projected threshold crossings for a group of
+    BankAccounts. Crossings are stored as the number of days from the
+    forecast date, in an array shaped
+    (scenarios, accounts, categories, tiers). As in check_thresholds, a
+    threshold is crossed once spending goes above it. A crossing of 0
+    means the threshold has already been crossed (or will be by any
+    further spending), and NaN means it is never crossed (the account
+    type has no such threshold, there is no spending to project, or the
+    category is locked first).
+    """
+
+    def __init__(self, accounts: list, categories: list,
+                 scenarios: np.ndarray, daily_rates: np.ndarray,
+                 days_until: np.ndarray, now: datetime):
+        """
+        Initializes a SpendForecast.
+        :param accounts: a list of BankAccount objects
+        :param categories: a list of strings
+        :param scenarios: an array of spending rate multipliers
+        :param daily_rates: an array of daily spending rates shaped
+        (accounts, categories)
+        :param days_until: an array of days until each crossing
+        :param now: a datetime the forecast was made at
+        """
+        self.accounts = accounts
+        self.categories = categories
+        self.scenarios = scenarios
+        self.daily_rates = daily_rates
+        self.days_until = days_until
+        self.now = now
+
+    def lock_dates(self, account_index: int, scenario: int = 0) -> dict:
+        """
+        Returns the projected date each tier is crossed for every budget
+        category of a single account under a single scenario.
+        :param account_index: an int indexing the forecast's accounts
+        :param scenario: an int indexing the forecast's scenarios
+        :return: a dictionary mapping category to a dictionary mapping
+        tier to a datetime, or None if the tier is never crossed
+        """
+        dates = {}
+        account = self.accounts[account_index]
+        for i, category in enumerate(self.categories):
+            if category not in account.budget:
+                continue
+            dates[category] = {}
+            for j, tier in enumerate(TIERS):
+                days = self.days_until[scenario, account_index, i, j]
+                if np.isnan(days):
+                    dates[category][tier] = None
+                else:
+                    dates[category][tier] = \
+                        self.now + timedelta(days=float(days))
+        return dates
+
+    def __str__(self):
+        formatted = "\n----- Spending Forecast -----\n"
+        for index, account in enumerate(self.accounts):
+            formatted += f"\nAccount Number: {account.account_number}\n"
+            for category, tiers in self.lock_dates(index).items():
+                formatted += f"\n| {category} |\n"
+                for tier, date in tiers.items():
+                    if date is None:
+                        projected = "Never"
+                    else:
+                        projected = date.strftime('%B %d, %Y')
+                    formatted += f"{tier.title()}: {projected}\n"
+        return formatted
+
+
+def account_thresholds(bank_account) -> tuple:
+    """
+    Returns the warning, exceed and lock thresholds of a BankAccount as
+    percentages. Account types without a lock threshold return NaN for
+    that tier.
+    :param bank_account: a BankAccount object
+    :return: a tuple of floats
+    """
+    return (float(bank_account.warning_threshold), 100.0,
+            float(getattr(bank_account, "lock_threshold", np.nan)))
+
+
+def forecast_accounts(accounts: list, scenarios=(1.0,),
+                      now: datetime = None,
+                      min_window_days: float = 1.0) -> SpendForecast:
+    """
+    Forecasts threshold crossings for many BankAccounts at once. Each
+    budget category's daily spending rate is its total spending divided
+    by the days since its first transaction (at least min_window_days).
+    Every scenario scales those rates by a multiplier, so a scenario of
+    0.5 asks what happens if spending is halved. Locked categories cannot
+    take any more spending, so only tiers they have already crossed get
+    a date. Rebel accounts are fully locked once two categories are
+    locked, so no crossings are projected after that point.
+    :param accounts: a list of BankAccount objects
+    :param scenarios: an iterable of floats
+    :param now: a datetime to forecast from, defaults to now
+    :param min_window_days: a float
+    :return: a SpendForecast object
+    """
+    if now is None:
+        now = datetime.now()
+    scenarios = np.asarray(scenarios, dtype=float).reshape(-1)
+
+    categories = []
+    for account in accounts:
+        for category in account.budget:
+            if category not in categories:
+                categories.append(category)
+    category_index = {category: i for i, category in enumerate(categories)}
+    n_accounts = len(accounts)
+    n_categories = len(categories)
+
+    budgets = np.full((n_accounts, n_categories), np.nan)
+    locked = np.zeros((n_accounts, n_categories), dtype=bool)
+    rebel = np.array([isinstance(account, RebelBankAccount)
+                      for account in accounts], dtype=bool)
+    thresholds = np.empty((n_accounts, len(TIERS)))
+    amounts = []
+    times = []
+    series = []
+    for a, account in enumerate(accounts):
+        thresholds[a] = account_thresholds(account)
+        for category, budget in account.budget.items():
+            budgets[a, category_index[category]] = budget.amount
+            locked[a, category_index[category]] = budget.locked
+        for category, transactions in account.transactions.items():
+            if category not in category_index:
+                continue
+            series_id = a * n_categories + category_index[category]
+            for transaction in transactions:
+                amounts.append(transaction.amount)
+                times.append(transaction.timestamp.timestamp())
+                series.append(series_id)
+
+    size = n_accounts * n_categories
+    amounts = np.asarray(amounts, dtype=float)
+    times = np.asarray(times, dtype=float)
+    series = np.asarray(series, dtype=np.intp)
+
+    totals = np.bincount(series, weights=amounts, minlength=size)
+    first = np.full(size, np.inf)
+    np.minimum.at(first, series, times)
+    elapsed = (now.timestamp() - first) / SECONDS_PER_DAY
+    window = np.maximum(elapsed, min_window_days)
+    with np.errstate(invalid="ignore"):
+        rates = np.where(np.isfinite(first), totals / window, 0.0)
+
+    totals = totals.reshape(n_accounts, n_categories)
+    # locked categories cannot take any more spending
+    rates = np.where(locked, 0.0, rates.reshape(n_accounts, n_categories))
+
+    # (accounts, categories, tiers) dollar amount of each threshold
+    limits = budgets[:, :, None] * thresholds[:, None, :] / 100
+    remaining = limits - totals[:, :, None]
+    # (scenarios, accounts, categories, tiers)
+    scaled = scenarios[:, None, None, None] * rates[None, :, :, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_until = remaining[None] / scaled
+    days_until = np.where(scaled > 0, days_until, np.nan)
+    days_until = np.where(remaining[None] < 0, 0.0, days_until)
+    days_until = np.where(np.isnan(limits)[None], np.nan, days_until)
+
+    # a Rebel account is fully locked when its second category locks
+    if n_categories >= 2:
+        lock_days = np.where(locked[None], 0.0, days_until[..., -1])
+        lock_days = np.where(np.isnan(lock_days), np.inf, lock_days)
+        full_lock = np.sort(lock_days, axis=-1)[..., 1]
+        full_lock = np.where(rebel[None], full_lock, np.inf)
+        days_until = np.where(days_until > full_lock[:, :, None, None],
+                              np.nan, days_until)
+
+    return SpendForecast(accounts, categories, scenarios, rates,
+                         days_until, now)
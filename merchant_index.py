@@ -0,0 +1,194 @@
+"""
+Contains code related to the MerchantIndex class.
+"""
+
+from bisect import bisect_left, insort
+from sys import intern
+from transaction import Transaction
+
+
+class MerchantIndex:
+    """
+    Represents an index of spending per store. For every account and
+    budget category, the index keeps the total spent and the number of
+    transactions at each store, along with a list of stores kept sorted
+    by total so top-N queries never scan transactions. Totals are kept
+    in whole cents so they stay exact as transactions are added and
+    reversed. Store names are interned so repeated merchants share
+    storage.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty MerchantIndex.
+        """
+        # (account number, category) -> {store: [cents, count]}
+        self.stats = {}
+        # (account number, category) -> [(-cents, store), ...] sorted
+        self.rankings = {}
+
+    @staticmethod
+    def to_cents(amount: float) -> int:
+        """
+        Converts a dollar amount to whole cents.
+        :param amount: a float
+        :return: an int
+        """
+        return int(round(amount * 100))
+
+    def _apply(self, key: tuple, store: str, cents: int,
+               count: int) -> None:
+        """
+        Applies a change in total and count to a single store, keeping
+        the sorted ranking up to date. Stores with no remaining
+        transactions are removed.
+        :param key: a tuple of account number and category
+        :param store: a string
+        :param cents: an int
+        :param count: an int
+        """
+        stats = self.stats.setdefault(key, {})
+        ranking = self.rankings.setdefault(key, [])
+        store = intern(store)
+
+        entry = stats.get(store)
+        if entry is None:
+            entry = stats[store] = [0, 0]
+        else:
+            del ranking[bisect_left(ranking, (-entry[0], store))]
+
+        entry[0] += cents
+        entry[1] += count
+        if entry[1] == 0:
+            del stats[store]
+        else:
+            insort(ranking, (-entry[0], store))
+
+    def _check_reversible(self, key: tuple, changes: dict) -> None:
+        """
+        Makes sure every store has enough recorded transactions to be
+        reversed, before any of them are changed. A store whose
+        transactions are all reversed must be left with no spending.
+        :param key: a tuple of account number and category
+        :param changes: a dictionary mapping store to [cents, count]
+        """
+        stats = self.stats.get(key, {})
+        for store, (cents, count) in changes.items():
+            if store not in stats or stats[store][1] < count:
+                raise ValueError(f"{store} has no transactions to reverse.")
+            if stats[store][1] == count and stats[store][0] != cents:
+                raise ValueError(f"{store} has no matching transactions to "
+                                 f"reverse.")
+
+    def _apply_many(self, account_number: str, category: str,
+                    transactions: list, sign: int) -> None:
+        """
+        Combines the changes of many transactions per store before
+        applying them, so each store is re-ranked once.
+        :param account_number: a string
+        :param category: a string
+        :param transactions: a list of Transaction objects
+        :param sign: 1 to add, -1 to reverse
+        """
+        changes = {}
+        for transaction in transactions:
+            change = changes.setdefault(transaction.store, [0, 0])
+            change[0] += self.to_cents(transaction.amount)
+            change[1] += 1
+
+        key = (account_number, category)
+        if sign < 0:
+            self._check_reversible(key, changes)
+        for store, (cents, count) in changes.items():
+            self._apply(key, store, sign * cents, sign * count)
+
+    def add(self, account_number: str, category: str,
+            transaction: Transaction) -> None:
+        """
+        Records a single transaction in the index.
+        :param account_number: a string
+        :param category: a string
+        :param transaction: a Transaction object
+        """
+        self._apply((account_number, category), transaction.store,
+                    self.to_cents(transaction.amount), 1)
+
+    def add_many(self, account_number: str, category: str,
+                 transactions: list) -> None:
+        """
+        Records many transactions from one budget category in the index.
+        :param account_number: a string
+        :param category: a string
+        :param transactions: a list of Transaction objects
+        """
+        self._apply_many(account_number, category, transactions, 1)
+
+    def reverse(self, account_number: str, category: str,
+                transaction: Transaction) -> None:
+        """
+        Removes a previously recorded transaction from the index.
+        :param account_number: a string
+        :param category: a string
+        :param transaction: a Transaction object
+        """
+        self.reverse_many(account_number, category, [transaction])
+
+    def reverse_many(self, account_number: str, category: str,
+                     transactions: list) -> None:
+        """
+        Removes many previously recorded transactions from one budget
+        category in the index.
+        :param account_number: a string
+        :param category: a string
+        :param transactions: a list of Transaction objects
+        """
+        self._apply_many(account_number, category, transactions, -1)
+
+    def add_account(self, bank_account) -> None:
+        """
+        Records every existing transaction of a BankAccount in the index.
+        :param bank_account: a BankAccount object
+        """
+        for category, transactions in bank_account.transactions.items():
+            self.add_many(bank_account.account_number, category,
+                          transactions)
+
+    def top_stores(self, account_number: str, category: str,
+                   n: int = 5) -> list:
+        """
+        Returns the stores with the highest totals in a budget category.
+        Ties are ordered by store name.
+        :param account_number: a string
+        :param category: a string
+        :param n: an int
+        :return: a list of (store, total, count) tuples
+        """
+        stats = self.stats.get((account_number, category), {})
+        ranking = self.rankings.get((account_number, category), [])
+        return [(store, stats[store][0] / 100, stats[store][1])
+                for _, store in ranking[:n]]
+
+    def store_total(self, account_number: str, category: str,
+                    store: str) -> float:
+        """
+        Returns the total spent at a store in a budget category.
+        :param account_number: a string
+        :param category: a string
+        :param store: a string
+        :return: a float
+        """
+        entry = self.stats.get((account_number, category), {}).get(
+            store.title())
+        if entry is None:
+            return 0.0
+        return entry[0] / 100
+
+    def __str__(self):
+        formatted = "\n----- Top Stores -----\n"
+        for account_number, category in self.rankings:
+            top = self.top_stores(account_number, category)
+            if len(top) > 0:
+                formatted += f"\n| {account_number} - {category} |\n"
+                for store, total, count in top:
+                    formatted += f"{store}: ${total:.2f} ({count})\n"
+        return formatted
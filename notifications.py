@@ -0,0 +1,431 @@
+"""
+Contains code related to delivering threshold notifications. Threshold
+events are placed on a bounded in-process queue and delivered to
+NotificationSinks by background workers, so slow sinks never hold up
+recording a transaction.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from abc import ABC
+from abc import abstractmethod
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class ThresholdEvent:
+    """
+    Represents a threshold event. Each ThresholdEvent contains the account
+    number and budget category it relates to, the tier that was crossed
+    (warning, exceed or lock), the percentage used of the budget, the
+    message shown to the user, and a timestamp of when it was created.
+    """
+
+    def __init__(self, account_number: str, category: str, tier: str,
+                 percentage: float, message: str):
+        """
+        Initializes a ThresholdEvent.
+        :param account_number: a string
+        :param category: a string, or None if the event relates to the
+        whole account
+        :param tier: a string
+        :param percentage: a float, or None if the event does not relate
+        to a single budget
+        :param message: a string
+        """
+        self.account_number = account_number
+        self.category = category
+        self.tier = tier
+        self.percentage = percentage
+        self.message = message
+        self.timestamp = datetime.now()
+
+    def to_dict(self) -> dict:
+        """
+        Returns the event as a dictionary suitable for serializing.
+        :return: a dictionary
+        """
+        return {
+            "account_number": self.account_number,
+            "category": self.category,
+            "tier": self.tier,
+            "percentage": self.percentage,
+            "message": self.message.strip(),
+            "timestamp": self.timestamp.isoformat()
+        }
+
+    def __str__(self):
+        category = self.category if self.category is not None \
+            else "All Categories"
+        return f"| {self.account_number} - {category} - " \
+               f"{self.tier.title()} |" \
+               f"\n{self.message.strip()}" \
+               f"\nAdded: {self.timestamp.strftime('%B %d, %Y at %H:%M PST')}"
+
+
+class NotificationSink(ABC):
+    """
+    An abstract base class that represents somewhere notifications are
+    delivered to. Sinks receive events in batches.
+    """
+
+    @abstractmethod
+    def deliver(self, events: list) -> None:
+        """
+        Delivers a batch of events. Raising an exception causes the
+        batch to be retried.
+        :param events: a list of ThresholdEvent objects
+        """
+        pass
+
+
+class FileSink(NotificationSink):
+    """
+    Defines a FileSink, which appends each event to a file as a line of
+    JSON. Each batch is written in a single call.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initializes a FileSink.
+        :param path: a string
+        """
+        self.path = path
+
+    def deliver(self, events: list) -> None:
+        """
+        Appends a batch of events to the file.
+        :param events: a list of ThresholdEvent objects
+        """
+        lines = "".join(json.dumps(event.to_dict()) + "\n"
+                        for event in events)
+        with open(self.path, "a") as file:
+            file.write(lines)
+
+
+class WebhookSink(NotificationSink):
+    """
+    Defines a WebhookSink, a local stand-in for a webhook. Each batch is
+    serialized to a JSON payload and passed to a send function. If no
+    send function is given, payloads are collected in the outbox.
+    """
+
+    def __init__(self, send=None):
+        """
+        Initializes a WebhookSink.
+        :param send: a function accepting a JSON string, or None
+        """
+        self.outbox = []
+        self.send = send if send is not None else self.outbox.append
+
+    def deliver(self, events: list) -> None:
+        """
+        Sends a batch of events as a single JSON payload.
+        :param events: a list of ThresholdEvent objects
+        """
+        self.send(json.dumps([event.to_dict() for event in events]))
+
+
+class LogSink(NotificationSink):
+    """
+    Defines a LogSink, which writes each event to a logger.
+    """
+
+    def __init__(self, log: logging.Logger = logger,
+                 level: int = logging.WARNING):
+        """
+        Initializes a LogSink.
+        :param log: a Logger object
+        :param level: an int
+        """
+        self.log = log
+        self.level = level
+
+    def deliver(self, events: list) -> None:
+        """
+        Logs a batch of events.
+        :param events: a list of ThresholdEvent objects
+        """
+        for event in events:
+            self.log.log(self.level, "%s %s %s: %s", event.account_number,
+                         event.category, event.tier, event.message.strip())
+
+
+class SinkWorker:
+    """
+    Delivers events to a single NotificationSink from a background
+    thread with its own bounded queue, so a slow or failing sink never
+    holds up the others and every sink sees events in the order they
+    were published. Repeated warnings for the same account and category
+    are coalesced: within a batch only the latest is kept, and across
+    batches a warning is skipped if a warning for that account and
+    category was delivered within the coalesce window. Any other tier
+    resets the window. Only batches the sink accepted count as delivered.
+    """
+
+    def __init__(self, sink: NotificationSink, max_queue_size: int,
+                 batch_size: int, batch_interval: float,
+                 coalesce_window: float, retries: int,
+                 retry_delay: float):
+        """
+        Initializes a SinkWorker and starts its thread.
+        :param sink: a NotificationSink object
+        :param max_queue_size: an int
+        :param batch_size: an int
+        :param batch_interval: a float
+        :param coalesce_window: a float
+        :param retries: an int
+        :param retry_delay: a float
+        """
+        self.sink = sink
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.coalesce_window = coalesce_window
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.dropped = 0
+        self.in_flight = 0
+        # (account number, category) -> (tier, time last delivered)
+        self.last_delivered = {}
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, daemon=True,
+            name=f"notifications-{type(sink).__name__}")
+        self.thread.start()
+
+    def publish(self, event: ThresholdEvent) -> bool:
+        """
+        Places an event on the queue without waiting.
+        :param event: a ThresholdEvent object
+        :return: a boolean flag representing whether it was queued
+        """
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def stop(self) -> None:
+        """
+        Asks the thread to stop once every queued event is delivered,
+        without waiting. If the queue is full, the thread stops when it
+        next finds the queue empty.
+        """
+        self.stopping.set()
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def undelivered(self) -> int:
+        """
+        Returns the number of events queued or being delivered.
+        :return: an int
+        """
+        return self.queue.qsize() + self.in_flight
+
+    def coalesce(self, events: list) -> list:
+        """
+        Keeps only the latest warning for each account and category in a
+        batch, and drops it if a warning for that account and category
+        was delivered within the coalesce window. Every other event is
+        kept in its original order.
+        :param events: a list of ThresholdEvent objects
+        :return: a list of ThresholdEvent objects
+        """
+        latest = {}
+        for index, event in enumerate(events):
+            key = (event.account_number, event.category)
+            if event.tier == "warning":
+                latest[key] = index
+
+        now = time.monotonic()
+        coalesced = []
+        for index, event in enumerate(events):
+            key = (event.account_number, event.category)
+            if event.tier == "warning":
+                if latest.get(key) != index:
+                    continue
+                tier, delivered = self.last_delivered.get(key, (None, 0.0))
+                if tier == "warning" and \
+                        now - delivered < self.coalesce_window:
+                    continue
+            coalesced.append(event)
+        return coalesced
+
+    def record_delivered(self, events: list) -> None:
+        """
+        Records the tier of the last event delivered for each account
+        and category, for coalescing later warnings.
+        :param events: a list of ThresholdEvent objects
+        """
+        now = time.monotonic()
+        for event in events:
+            key = (event.account_number, event.category)
+            self.last_delivered[key] = (event.tier, now)
+
+    def _next_batch(self) -> tuple:
+        """
+        Waits for an event, then collects more until the batch is full
+        or the batch interval has passed.
+        :return: a tuple of a list of events and a boolean flag
+        representing whether the worker should stop
+        """
+        if self.stopping.is_set() and self.queue.empty():
+            return [], True
+        event = self.queue.get()
+        if event is None:
+            return [], True
+
+        batch = [event]
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    event = self.queue.get(timeout=remaining)
+                else:
+                    event = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is None:
+                return batch, True
+            batch.append(event)
+        return batch, False
+
+    def _deliver(self, events: list) -> bool:
+        """
+        Delivers a batch to the sink, retrying on failure.
+        :param events: a list of ThresholdEvent objects
+        :return: a boolean flag representing whether it was delivered
+        """
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                self.sink.deliver(events)
+                return True
+            except Exception:
+                if attempt == self.retries:
+                    logger.exception("Unable to deliver %d notifications "
+                                     "to %s.", len(events),
+                                     type(self.sink).__name__)
+                    return False
+                time.sleep(delay)
+                delay *= 2
+
+    def _run(self) -> None:
+        """
+        Delivers batches of events until the worker is stopped.
+        """
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            self.in_flight = len(batch)
+            events = self.coalesce(batch)
+            if len(events) > 0 and self._deliver(events):
+                self.record_delivered(events)
+            self.in_flight = 0
+
+
+class NotificationPipeline:
+    """
+    Delivers ThresholdEvents to NotificationSinks in the background, with
+    one SinkWorker per sink. Publishing an event never blocks: if a
+    sink's queue is full the event is dropped for that sink and counted.
+    The pipeline is closed automatically when the interpreter exits, and
+    can also be used as a context manager. Closing waits at most
+    close_timeout seconds for queued events to be delivered.
+    """
+
+    def __init__(self, sinks: list, max_queue_size: int = 1000,
+                 batch_size: int = 50, batch_interval: float = 0.5,
+                 coalesce_window: float = 300.0, retries: int = 3,
+                 retry_delay: float = 0.5, close_timeout: float = 5.0):
+        """
+        Initializes a NotificationPipeline and starts a worker per sink.
+        :param sinks: a list of NotificationSink objects
+        :param max_queue_size: an int, the most events waiting per sink
+        :param batch_size: an int, the most events delivered at once
+        :param batch_interval: a float, the seconds to wait for a batch
+        to fill
+        :param coalesce_window: a float, the seconds during which repeated
+        warnings for the same account and category are skipped
+        :param retries: an int
+        :param retry_delay: a float, the seconds to wait before the first
+        retry
+        :param close_timeout: a float, the most seconds close waits for
+        queued events to be delivered
+        """
+        self.sinks = sinks
+        self.close_timeout = close_timeout
+        self.closed = False
+        self.lock = threading.Lock()
+        self.workers = [SinkWorker(sink, max_queue_size, batch_size,
+                                   batch_interval, coalesce_window,
+                                   retries, retry_delay)
+                        for sink in sinks]
+        atexit.register(self.close)
+
+    @property
+    def dropped(self) -> int:
+        """
+        Returns the number of events dropped because a queue was full.
+        :return: an int
+        """
+        return sum(worker.dropped for worker in self.workers)
+
+    def publish(self, event: ThresholdEvent) -> bool:
+        """
+        Places an event on every sink's queue without waiting.
+        :param event: a ThresholdEvent object
+        :return: a boolean flag representing whether every sink queued it
+        """
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Unable to publish, the notification "
+                                   "pipeline is closed.")
+            queued = True
+            for worker in self.workers:
+                queued = worker.publish(event) and queued
+            return queued
+
+    def close(self) -> int:
+        """
+        Stops accepting events and waits up to close_timeout seconds for
+        queued events to be delivered. Any events left undelivered are
+        logged. Closing more than once has no effect.
+        :return: an int representing the number of events left
+        undelivered
+        """
+        with self.lock:
+            if self.closed:
+                return 0
+            self.closed = True
+        atexit.unregister(self.close)
+        for worker in self.workers:
+            worker.stop()
+
+        deadline = time.monotonic() + self.close_timeout
+        undelivered = 0
+        for worker in self.workers:
+            worker.thread.join(max(deadline - time.monotonic(), 0))
+            if worker.thread.is_alive():
+                left = worker.undelivered()
+                undelivered += left
+                logger.warning("%d notifications for %s were not "
+                               "delivered before closing.", left,
+                               type(worker.sink).__name__)
+        return undelivered
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
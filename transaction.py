@@ -3,6 +3,7 @@ Contains code relating to the Transaction class.
 """
 
 from datetime import datetime
+from sys import intern
 
 
 class Transaction:
@@ -20,7 +21,7 @@ class Transaction:
         :param store: a string
         """
         self.amount = amount
-        self.store = store.title()
+        self.store = intern(store.title())
         self.timestamp = datetime.now()
 
     def __str__(self):